@@ -161,6 +161,15 @@ this.learningManager = null;
         this.analysisWorker.postMessage({ type: 'prime-indicators', data: payload });
 		this.socketExporter.broadcast({ type: 'historical-candles', data: payload });
       });
+      this.tcpConnector.on('historical-candles-delta', (payload) => {
+        logger.info(`[APP] Delta histórico de ${payload.candles.length} velas para ${payload.asset} (${payload.timeframe}) recibido.`);
+        this.analysisWorker.postMessage({ type: 'merge-indicators', data: payload });
+        this.socketExporter.broadcast({ type: 'historical-candles-delta', data: payload });
+      });
+      this.tcpConnector.on('asset-evicted', (payload) => {
+        logger.info(`[APP] ${payload.asset} desalojado por el Harvester. Reiniciando su secuencia de pips.`);
+        this.pipWorker.postMessage({ type: 'reset-sequence', data: payload });
+      });
       this.pipWorker.on('message', (msg) => {
         if (msg.type === 'candleClosed') {
           this.analysisWorker.postMessage({ type: 'candle', data: msg.data });
@@ -2,6 +2,7 @@ import asyncio
 import json
 import logging
 import random
+import zlib
 from playwright.async_api import async_playwright
 
 # ==================================================================================================
@@ -25,6 +26,18 @@ WEBSOCKET_URL_FRAGMENT = "ws2.qxbroker.com/socket.io"
 # Timeframes requeridos en segundos para la precarga de cada activo
 REQUIRED_TIMEFRAMES = {60, 300, 600, 900, 1800} # 1m, 5m, 10m, 15m, 30m
 
+# Número de páginas (shards) entre las que se reparten los activos. Cada shard tiene su propio
+# socket, ActiveAssetManager y watchdog. Con 1 se mantiene el comportamiento de una sola pestaña.
+SHARD_COUNT = 1
+
+# Ciclo de vida de los activos: warming -> live -> idle -> evicted.
+# Un activo live sin pips durante ASSET_IDLE_AFTER_SECONDS pasa a idle y deja de refrescarse;
+# vuelve a live con el siguiente pip que llegue.
+# Un activo idle (o atascado en warming) durante ASSET_EVICTION_TTL_SECONDS se libera por completo;
+# si después llega un pip o un histórico suyo, se detecta y calienta de nuevo.
+ASSET_IDLE_AFTER_SECONDS = 60
+ASSET_EVICTION_TTL_SECONDS = 30 * 60
+
 # --- Configuración del Logging ---
 logging.basicConfig(
     level=LOG_LEVEL,
@@ -32,6 +45,45 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# ==================================================================================================
+# === AssetRecord (ESTADO COMPACTO POR ACTIVO) ===
+# ==================================================================================================
+ASSET_WARMING = "warming"
+ASSET_LIVE = "live"
+ASSET_IDLE = "idle"
+ASSET_EVICTED = "evicted"
+
+# Cada timeframe requerido ocupa un bit de `ready_mask`; el activo está listo cuando están todos.
+TIMEFRAME_BITS = {tf: 1 << i for i, tf in enumerate(sorted(REQUIRED_TIMEFRAMES))}
+ALL_TIMEFRAMES_MASK = (1 << len(REQUIRED_TIMEFRAMES)) - 1
+
+class AssetRecord:
+    """
+    Registro único por activo. Sustituye a los diccionarios paralelos (estado de precarga,
+    timestamps del watchdog e histórico reenviado) para que todo se libere de una vez al desalojarlo.
+    """
+    __slots__ = ("name", "lifecycle", "ready_mask", "last_pip_time", "last_refresh_time", "changed_at", "forwarded_candles", "last_forwarded_pip_ts")
+
+    def __init__(self, name, now):
+        self.name = name
+        self.lifecycle = ASSET_WARMING
+        self.ready_mask = 0
+        self.last_pip_time = None
+        self.last_refresh_time = None
+        self.changed_at = now
+        # { timeframe: { tiempo: (open, close, high, low, volume) } }
+        self.forwarded_candles = {}
+        # Timestamp del bróker del último pip reenviado; evita duplicar pips de reanudación.
+        self.last_forwarded_pip_ts = None
+
+    @property
+    def is_ready(self):
+        return self.ready_mask == ALL_TIMEFRAMES_MASK
+
+    def set_lifecycle(self, lifecycle, now):
+        self.lifecycle = lifecycle
+        self.changed_at = now
+
 # ==================================================================================================
 # === ActiveAssetManager (ESTRATEGIA FINAL: CANAL LATERAL) ===
 # ==================================================================================================
@@ -40,31 +92,37 @@ class ActiveAssetManager:
     Gestiona los activos, sus secuencias de carga, los mecanismos de refresco
     y la simulación de actividad de usuario.
     """
-    def __init__(self):
+    def __init__(self, shard_id=0):
+        self.shard_id = shard_id
         self.page = None
-        self.active_assets = set()
+        # `active_assets`: { 'activo': AssetRecord } de los activos asignados a este shard.
+        self.active_assets = {}
         self.lock = asyncio.Lock()
-        self.primer_activo_procesado = False
+        # Se activa en `set_page`; los calentamientos que llegan antes esperan a que exista la página.
+        self.page_ready = asyncio.Event()
 
         # --- DOCUMENTACIÓN DE COMPONENTES DEL WATCHDOG Y REFRESH ---
-        # `last_pip_timestamps`: Diccionario. Almacena el último momento en que se vio un pip
-        # para cada activo. Es la memoria del watchdog para detectar inactividad.
-        # { 'activo': timestamp }
-        self.last_pip_timestamps = {} 
+        # `AssetRecord.last_pip_time`: último momento en que se vio un pip para cada activo.
+        # Es la memoria del watchdog para detectar inactividad (None hasta completar la precarga).
         
         # `refreshing_now`: Conjunto. Actúa como un "lock" o semáforo para cada activo.
         # Si un activo está en este conjunto, significa que uno de los sistemas de refresco
         # está trabajando en él, previniendo que el otro sistema interfiera y cause una
         # condición de carrera.
         self.refreshing_now = set()   
+
+        # `warmup_tasks`: { 'activo': Task } de los calentamientos en curso, para poder
+        # cancelarlos si el activo se desaloja antes de terminar.
+        self.warmup_tasks = {}
         # --- FIN DE DOCUMENTACIÓN ---
 
-        logging.info("[ActiveManager] Inicializado en modo de canal lateral.")
+        logging.info(f"[ActiveManager] Shard {shard_id} inicializado en modo de canal lateral.")
 
     def set_page(self, page):
         """Recibe y almacena la página de Playwright."""
         self.page = page
-        logging.info("[ActiveManager] Página de Playwright recibida.")
+        self.page_ready.set()
+        logging.info(f"[ActiveManager] Página de Playwright recibida para el shard {self.shard_id}.")
 
     def start_background_tasks(self):
         """Inicia todas las tareas de fondo: refrescos, watchdog y simulación de actividad."""
@@ -100,17 +158,49 @@ class ActiveAssetManager:
         Activa el monitoreo de pips para un activo que ha completado su precarga.
         Este es el punto de entrada para que el watchdog comience a vigilar un activo.
         """
-        if asset_name in self.active_assets and asset_name not in self.last_pip_timestamps:
+        record = self.active_assets.get(asset_name)
+        if record and record.last_pip_time is None:
             logging.info(f"[Watchdog] Iniciando monitoreo de pips para {asset_name}.")
-            self.last_pip_timestamps[asset_name] = asyncio.get_running_loop().time()
+            record.last_pip_time = asyncio.get_running_loop().time()
 
     def update_last_pip_time(self, asset_name):
         """
         Actualiza el timestamp del último pip recibido. Se llama cada vez que llega un pip.
-        Esto "resetea" el contador de 5 segundos del watchdog.
+        Esto "resetea" el contador de 5 segundos del watchdog y reactiva un activo idle.
+        """
+        record = self.active_assets.get(asset_name)
+        if record and record.last_pip_time is not None:
+            now = asyncio.get_running_loop().time()
+            record.last_pip_time = now
+            if record.lifecycle == ASSET_IDLE:
+                logging.info(f"[Watchdog] {asset_name} vuelve a recibir pips. Pasa de idle a live.")
+                record.set_lifecycle(ASSET_LIVE, now)
+
+    def remove_asset(self, asset_name):
+        """Olvida un activo desalojado: deja de vigilarlo y refrescarlo y cancela su calentamiento pendiente."""
+        self.active_assets.pop(asset_name, None)
+        task = self.warmup_tasks.pop(asset_name, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+
+    async def resync_asset(self, asset_name):
         """
-        if asset_name in self.last_pip_timestamps:
-            self.last_pip_timestamps[asset_name] = asyncio.get_running_loop().time()
+        Vuelve a pedir todos los timeframes de un activo ya calentado (secuencia de calentamiento
+        completa). Se usa cuando se conecta un cliente de Node.js nuevo, que necesita re-impregnarse.
+        """
+        if not self.page:
+            return
+        async with self.lock:
+            if asset_name not in self.active_assets or asset_name in self.refreshing_now:
+                return
+            self.refreshing_now.add(asset_name)
+            try:
+                warmup_sequence = self._get_warmup_sequence(asset_name)
+                await self._run_sequence(warmup_sequence, sequence_name=f"re-sincronización ({asset_name})")
+            except Exception as e:
+                logging.error(f"[ActiveManager] Error durante la re-sincronización de {asset_name}: {e}")
+            finally:
+                self.refreshing_now.discard(asset_name)
 
     async def _force_refresh_asset(self, asset_name):
         """
@@ -121,13 +211,14 @@ class ActiveAssetManager:
             logging.warning(f"[Watchdog] El refresco para {asset_name} ya está en curso.")
             return
         
-        logging.warning(f"[Watchdog] No se han recibido pips para {asset_name} en 5s. Forzando refresco.")
+        logging.warning(f"[Watchdog] No se han recibido pips recientes para {asset_name}. Forzando refresco.")
         self.refreshing_now.add(asset_name)
         try:
             refresh_sequence = self._get_refresh_sequence(asset_name)
             await self._run_sequence(refresh_sequence, sequence_name=f"refresco forzado ({asset_name})")
-            if asset_name in self.last_pip_timestamps:
-                self.last_pip_timestamps[asset_name] = asyncio.get_running_loop().time()
+            record = self.active_assets.get(asset_name)
+            if record:
+                record.last_refresh_time = asyncio.get_running_loop().time()
         finally:
             self.refreshing_now.remove(asset_name)
 
@@ -139,19 +230,21 @@ class ActiveAssetManager:
         while True:
             await asyncio.sleep(2)
             
-            if not self.page or not self.last_pip_timestamps:
+            if not self.page or not self.active_assets:
                 continue
 
             current_time = asyncio.get_running_loop().time()
-            
-            logging.debug(f"[Watchdog] Verificando {len(self.last_pip_timestamps)} activo(s): {list(self.last_pip_timestamps.keys())}")
 
-            assets_to_check = list(self.last_pip_timestamps.keys())
+            live_records = [r for r in self.active_assets.values() if r.lifecycle == ASSET_LIVE and r.last_pip_time is not None]
+            logging.debug(f"[Watchdog] Verificando {len(live_records)} activo(s): {[r.name for r in live_records]}")
 
-            for asset in assets_to_check:
-                last_pip_time = self.last_pip_timestamps.get(asset)
-                if last_pip_time and (current_time - last_pip_time > 5):
-                    asyncio.create_task(self._force_refresh_asset(asset))
+            for record in live_records:
+                silence = current_time - record.last_pip_time
+                if silence > ASSET_IDLE_AFTER_SECONDS:
+                    logging.warning(f"[Watchdog] {record.name} sin pips durante {int(silence)}s. Pasa a idle y deja de refrescarse hasta recibir un pip o ser desalojado.")
+                    record.set_lifecycle(ASSET_IDLE, current_time)
+                elif silence > 5 and (record.last_refresh_time is None or current_time - record.last_refresh_time > 5):
+                    asyncio.create_task(self._force_refresh_asset(record.name))
     
     async def _simulate_user_activity_loop(self):
         """
@@ -187,9 +280,10 @@ class ActiveAssetManager:
             except Exception as e:
                 logging.error(f"[ActivitySim] Error durante la simulación de actividad: {e}")
 
-    def _get_warmup_sequence(self, asset_name, is_first_asset=False):
+    def _get_warmup_sequence(self, asset_name, has_1m_history=False):
         """
-        Genera la secuencia de calentamiento. Omite la temporalidad de 1m (60s) si es el primer activo.
+        Genera la secuencia de calentamiento. Omite la temporalidad de 1m (60s) si la página dueña
+        ya recibió el histórico de 1m del activo (p. ej. el activo abierto por defecto en la pestaña).
         """
         def create_msg(event, data):
             return f'42{json.dumps([event, data], separators=(",", ":"))}'
@@ -203,12 +297,12 @@ class ActiveAssetManager:
             create_msg("instruments/update", {"asset": asset_name, "period": 300}), create_msg("chart_notification/get", {"asset": asset_name, "version": "1.0.0"}), create_msg("chart_notification/get", {"asset": asset_name, "version": "1.0.0"}), create_msg("settings/store", get_settings_payload(6)), create_msg("chart_notification/get", {"asset": asset_name, "version": "1.0.0"}),
         ]
 
-        if not is_first_asset:
+        if not has_1m_history:
              sequence.extend([
                 create_msg("instruments/update", {"asset": asset_name, "period": 60}), create_msg("chart_notification/get", {"asset": asset_name, "version": "1.0.0"}), create_msg("chart_notification/get", {"asset": asset_name, "version": "1.0.0"}), create_msg("chart_notification/get", {"asset": asset_name, "version": "1.0.0"}), create_msg("settings/store", get_settings_payload(4)),
             ])
         else:
-            logging.warning(f"[ActiveManager] Se generó una secuencia de calentamiento para el primer activo ({asset_name}) omitiendo la temporalidad de 1m.")
+            logging.warning(f"[ActiveManager] Se generó una secuencia de calentamiento para {asset_name} omitiendo la temporalidad de 1m (ya recibida).")
 
         return sequence
 
@@ -244,6 +338,10 @@ class ActiveAssetManager:
                 assets_to_refresh = list(self.active_assets)
 
             for asset in assets_to_refresh:
+                record = self.active_assets.get(asset)
+                if record is None or record.lifecycle == ASSET_IDLE:
+                    continue
+
                 if not self.page:
                     logging.warning("[ActiveManager] Omitiendo refresco programado, la página no está disponible.")
                     break
@@ -267,10 +365,18 @@ class ActiveAssetManager:
                 await asyncio.sleep(random.uniform(60, 90))
             logging.info("[ActiveManager] Ciclo de refresco de todos los activos completado.")
 
-    async def add_asset(self, asset_name):
+    async def add_asset(self, asset_name, record):
+        self.warmup_tasks[asset_name] = asyncio.current_task()
+        try:
+            await self._warm_up_asset(asset_name, record)
+        finally:
+            if self.warmup_tasks.get(asset_name) is asyncio.current_task():
+                del self.warmup_tasks[asset_name]
+
+    async def _warm_up_asset(self, asset_name, record):
         if not self.page:
-            logging.error(f"[ActiveManager] No se puede procesar {asset_name}, la página no está asignada.")
-            return
+            logging.info(f"[ActiveManager] {asset_name} en espera: la página del shard {self.shard_id} aún no está asignada.")
+            await self.page_ready.wait()
 
         try:
             await self.page.wait_for_function("() => window.harvesterSocket", timeout=15000)
@@ -279,67 +385,163 @@ class ActiveAssetManager:
             return
 
         async with self.lock:
-            if asset_name not in self.active_assets:
-                es_el_primero = not self.primer_activo_procesado
-                
+            # El registro pudo desalojarse mientras se esperaba la página, el socket o el lock.
+            if record.lifecycle == ASSET_EVICTED:
+                logging.info(f"[ActiveManager] {asset_name} fue desalojado antes de calentarse. Se omite.")
+                return
+
+            if self.active_assets.get(asset_name) is not record:
                 logging.info(f"[ActiveManager] Procesando nuevo activo {asset_name} para calentamiento.")
                 
                 # <<< INICIO DE LA CORRECCIÓN DE LA CONDICIÓN DE CARRERA >>>
                 # Se mueve esta línea ANTES de la secuencia de calentamiento.
                 # Esto asegura que el activo ya se considere "activo" para cuando
                 # la precarga termine y se intente iniciar el watchdog.
-                self.active_assets.add(asset_name)
+                self.active_assets[asset_name] = record
                 # <<< FIN DE LA CORRECCIÓN DE LA CONDICIÓN DE CARRERA >>>
 
-                warmup_sequence = self._get_warmup_sequence(asset_name, is_first_asset=es_el_primero)
+                # Si la precarga se completó mientras se esperaba el lock (p. ej. el activo por defecto
+                # de la pestaña), start_pip_monitoring no lo encontró: se inicia el monitoreo aquí.
+                if record.lifecycle == ASSET_LIVE:
+                    self.start_pip_monitoring(asset_name)
+
+                # Solo cuenta el 1m recibido por esta página: mark_as_received ignora las páginas no dueñas.
+                has_1m_history = bool(record.ready_mask & TIMEFRAME_BITS[60])
+                warmup_sequence = self._get_warmup_sequence(asset_name, has_1m_history=has_1m_history)
                 
                 await self._run_sequence(warmup_sequence, sequence_name="calentamiento")
-                                
-                if es_el_primero:
-                    self.primer_activo_procesado = True
                 
                 logging.info(f"[ActiveManager] Calentamiento para {asset_name} completado. Activo añadido a la lista de refresco.")
 
+def shard_for(asset_name, shard_count=SHARD_COUNT):
+    """Asigna un activo a un shard de forma estable (crc32, no `hash()`, que varía entre ejecuciones)."""
+    return zlib.crc32(asset_name.encode('utf-8')) % shard_count
+
+class ShardedAssetManager:
+    """
+    Reparte los activos entre varios ActiveAssetManager, uno por página.
+    Expone la misma interfaz que ActiveAssetManager y delega en el shard dueño de cada activo,
+    de modo que un activo siempre se calienta, refresca y vigila en la misma página.
+    """
+    def __init__(self, shard_count=SHARD_COUNT):
+        self.shards = [ActiveAssetManager(shard_id=i) for i in range(shard_count)]
+        logging.info(f"[ShardManager] Inicializado con {shard_count} shard(s).")
+
+    def owner_of(self, asset_name):
+        return shard_for(asset_name, len(self.shards))
+
+    def manager_for(self, asset_name):
+        return self.shards[self.owner_of(asset_name)]
+
+    def start_background_tasks(self):
+        for shard in self.shards:
+            shard.start_background_tasks()
+
+    async def add_asset(self, asset_name, record):
+        await self.manager_for(asset_name).add_asset(asset_name, record)
+
+    def start_pip_monitoring(self, asset_name):
+        self.manager_for(asset_name).start_pip_monitoring(asset_name)
+
+    def update_last_pip_time(self, asset_name):
+        self.manager_for(asset_name).update_last_pip_time(asset_name)
+
+    def remove_asset(self, asset_name):
+        self.manager_for(asset_name).remove_asset(asset_name)
+
+    async def resync_asset(self, asset_name):
+        await self.manager_for(asset_name).resync_asset(asset_name)
+
 class AssetStateManager:
-    def __init__(self, active_asset_manager=None):
+    def __init__(self, active_asset_manager=None, tcp_server=None):
+        # `states`: { 'activo': AssetRecord }. Único registro de estado por activo.
         self.states = {}
         self.active_asset_manager = active_asset_manager
+        self.tcp_server = tcp_server
         logging.info("Gestor de Estado de Activos inicializado.")
+    def start_background_tasks(self):
+        asyncio.create_task(self._eviction_loop())
     def _get_or_create_asset_state(self, asset_name):
         if asset_name not in self.states:
-            self.states[asset_name] = {tf: False for tf in REQUIRED_TIMEFRAMES}
-            self.states[asset_name]["_notified"] = False
+            record = AssetRecord(asset_name, asyncio.get_running_loop().time())
+            self.states[asset_name] = record
             logging.info(f"Nuevo activo detectado: {asset_name}. Estado de precarga inicializado.")
             if self.active_asset_manager:
                 logging.info(f"Enviando {asset_name} al ActiveAssetManager para procesar.")
-                asyncio.create_task(self.active_asset_manager.add_asset(asset_name))
+                asyncio.create_task(self.active_asset_manager.add_asset(asset_name, record))
         return self.states[asset_name]
+    def get_record(self, asset_name):
+        return self.states.get(asset_name)
+    def clear_forwarded_candles(self):
+        """
+        Olvida los rangos de velas reenviados. Un cliente de Node.js nuevo no tiene ese estado,
+        así que el siguiente histórico de cada activo debe salir como snapshot completo.
+        """
+        for record in self.states.values():
+            record.forwarded_candles.clear()
+    def resync_after_reconnect(self):
+        """
+        Se ejecuta al conectarse un cliente de Node.js. Además de olvidar los rangos reenviados,
+        vuelve a pedir todos los timeframes de los activos ya calentados: el refresco solo pide 1m,
+        así que sin esto 5m, 10m, 15m y 30m no volverían a llegar al nuevo IndicatorEngine.
+        """
+        self.clear_forwarded_candles()
+        if not self.active_asset_manager:
+            return
+        for record in self.states.values():
+            if record.lifecycle in (ASSET_LIVE, ASSET_IDLE):
+                asyncio.create_task(self.active_asset_manager.resync_asset(record.name))
+    def discover_asset(self, asset_name):
+        """Registra un activo (visto en otra página o desalojado) para que su shard lo caliente."""
+        self._get_or_create_asset_state(asset_name)
     def mark_as_received(self, asset_name, timeframe_seconds):
         if timeframe_seconds in REQUIRED_TIMEFRAMES:
-            state = self._get_or_create_asset_state(asset_name)
-            if not state.get(timeframe_seconds, False):
+            record = self._get_or_create_asset_state(asset_name)
+            bit = TIMEFRAME_BITS[timeframe_seconds]
+            if not record.ready_mask & bit:
                 logging.info(f"Precarga para {asset_name} en timeframe {timeframe_seconds}s [OK]")
-                state[timeframe_seconds] = True
+                record.ready_mask |= bit
                 self.check_if_ready(asset_name)
     def is_ready_for_pips(self, asset_name):
-        return self.states.get(asset_name, {}).get("_notified", False)
+        record = self.states.get(asset_name)
+        return record is not None and record.lifecycle != ASSET_WARMING
     
     def check_if_ready(self, asset_name):
-        state = self._get_or_create_asset_state(asset_name)
-        if state.get("_notified", False):
+        record = self._get_or_create_asset_state(asset_name)
+        if record.lifecycle != ASSET_WARMING:
             return
 
-        is_ready = all(state.get(tf, False) for tf in REQUIRED_TIMEFRAMES)
-        
-        if is_ready:
+        if record.is_ready:
             logging.warning(f"¡PRECARGA COMPLETA! El activo {asset_name} está listo. Se habilita el flujo de pips en tiempo real.")
-            state["_notified"] = True
+            record.set_lifecycle(ASSET_LIVE, asyncio.get_running_loop().time())
             if self.active_asset_manager:
                 self.active_asset_manager.start_pip_monitoring(asset_name)
         else:
-            missing_timeframes = [tf for tf in REQUIRED_TIMEFRAMES if not state.get(tf, False)]
+            missing_timeframes = [tf for tf, bit in TIMEFRAME_BITS.items() if not record.ready_mask & bit]
             logging.info(f"[Precarga] Esperando por {asset_name}. Faltan timeframes (segundos): {missing_timeframes}")
 
+    def evict(self, asset_name):
+        """Libera todo el estado de un activo. Si vuelve a aparecer, se detecta y calienta de nuevo."""
+        record = self.states.pop(asset_name, None)
+        if record is None:
+            return
+        record.set_lifecycle(ASSET_EVICTED, asyncio.get_running_loop().time())
+        logging.warning(f"[Lifecycle] Activo {asset_name} desalojado. Estado liberado.")
+        if self.active_asset_manager:
+            self.active_asset_manager.remove_asset(asset_name)
+        if self.tcp_server:
+            self.tcp_server.forget_asset(asset_name)
+
+    async def _eviction_loop(self):
+        """Desaloja los activos que llevan más de ASSET_EVICTION_TTL_SECONDS en idle o atascados en warming."""
+        while True:
+            await asyncio.sleep(30)
+            now = asyncio.get_running_loop().time()
+            expired = [r.name for r in self.states.values()
+                       if r.lifecycle != ASSET_LIVE and now - r.changed_at > ASSET_EVICTION_TTL_SECONDS]
+            for asset_name in expired:
+                self.evict(asset_name)
+
 class TCPServer:
     def __init__(self, host, port):
         self.host, self.port = host, port
@@ -347,6 +549,8 @@ class TCPServer:
         self.message_queue = asyncio.Queue()
         self.ready_event = asyncio.Event()
         self.sequence_counters = {}
+        # Callback opcional que se ejecuta cada vez que se conecta un cliente de Node.js.
+        self.on_client_connected = None
     async def _sender_loop(self):
         logging.info("Bucle de envío iniciado. Esperando mensajes...")
         DELIMITER = b'\n==EOM==\n'
@@ -374,6 +578,15 @@ class TCPServer:
         client_addr = writer.get_extra_info('peername')
         logging.info(f"Bot de Node.js conectado desde {client_addr}")
         self.writer = writer
+        if self.on_client_connected:
+            self.on_client_connected()
+    def forget_asset(self, asset_name):
+        """
+        Libera el contador de secuencia de un activo desalojado y avisa a Node.js para que
+        reinicie su secuencia esperada; la cola FIFO garantiza que el aviso llega antes de sus nuevos pips.
+        """
+        if self.sequence_counters.pop(asset_name, None) is not None:
+            self.send({"type": "asset-evicted", "payload": {"asset": asset_name}})
     def send(self, data):
         if data.get("type") == "pip":
             asset = data.get("payload", {}).get("asset")
@@ -396,7 +609,20 @@ class WebSocketHarvester:
         self.tcp_server = tcp_server
         self.asset_manager = asset_manager
         self.active_asset_manager = active_asset_manager
-        self._sent_historical_packets = set()
+
+    @staticmethod
+    def _format_candle(time, values):
+        return {'time': time, 'open': values[0], 'close': values[1], 'high': values[2], 'low': values[3], 'volume': values[4]}
+
+    @staticmethod
+    def _has_gap(forwarded, incoming, timeframe):
+        """
+        Hay hueco si el nuevo histórico empieza después de la vela siguiente a la última reenviada:
+        en ese caso un delta dejaría velas faltantes en el IndicatorEngine.
+        """
+        if not forwarded or not incoming:
+            return True
+        return min(incoming) > max(forwarded) + timeframe
 
     def _parse_data(self, payload_str):
         try:
@@ -404,17 +630,17 @@ class WebSocketHarvester:
             data = json.loads(clean_payload_str)
             if isinstance(data, dict):
                 timeframe, asset, pips, candles = data.get("period"), data.get("asset"), data.get("history"), data.get("candles")
-                if all((timeframe, asset, pips is not None, candles is not None)):
+                if all((timeframe, isinstance(asset, str), pips is not None, candles is not None)):
                     return "historical", {"tf": timeframe, "asset": asset, "pips": pips, "candles": candles}
             elif isinstance(data, list) and len(data) > 0 and isinstance(data[0], list):
                 pip_data = data[0]
-                if len(pip_data) >= 3:
+                if len(pip_data) >= 3 and isinstance(pip_data[0], str):
                     asset, timestamp, price = pip_data[0], pip_data[1], pip_data[2]
                     return "realtime_pip", {"asset": asset, "timestamp": timestamp, "price": price}
         except (json.JSONDecodeError, AttributeError, IndexError, TypeError): pass
         return None, None
         
-    async def on_websocket_frame(self, payload):
+    async def on_websocket_frame(self, payload, shard_id=0):
         if isinstance(payload, bytes): decoded_payload = payload.decode('utf-8', errors='ignore')
         elif isinstance(payload, str): decoded_payload = payload
         else: return
@@ -422,38 +648,84 @@ class WebSocketHarvester:
         msg_type, data = self._parse_data(decoded_payload)
         if not msg_type: return
 
+        # Solo la página dueña del activo reenvía sus datos; así cada activo tiene una única
+        # fuente de pips y el orden por activo se mantiene aunque varias páginas lo reciban.
+        if self.active_asset_manager.owner_of(data["asset"]) != shard_id:
+            self.asset_manager.discover_asset(data["asset"])
+            return
+
         if msg_type == "historical":
             asset, timeframe = data["asset"], data["tf"]
-            packet_id = (asset, timeframe)
 
-            if packet_id in self._sent_historical_packets:
-                logging.debug(f"Paquete histórico duplicado para {asset} ({timeframe}s) detectado. Se omite el envío.")
-                return
-            
             logging.info(f"Paquete histórico recibido para {asset} con timeframe {timeframe}s.")
             if timeframe in REQUIRED_TIMEFRAMES:
                 self.asset_manager.mark_as_received(asset, timeframe)
                 candles, pips = data["candles"], data["pips"]
-                formatted_candles = [{'time': c[0], 'open': c[1], 'close': c[2], 'high': c[3], 'low': c[4], 'volume': c[5]} for c in candles]
-                message = {"type": "historical-candles", "payload": {"asset": asset, "timeframe": timeframe, "candles": formatted_candles}}
-                
-                if self.tcp_server.send(message):
-                    logging.info(f"Encolado paquete histórico de {len(formatted_candles)} velas para {asset} ({timeframe}s).")
-                    self._sent_historical_packets.add(packet_id)
-
+                # Último rango de velas reenviado a Node.js. Permite enviar solo deltas en los re-sincronizados.
+                record = self.asset_manager.get_record(asset)
+                incoming = {c[0]: tuple(c[1:6]) for c in candles}
+                forwarded = record.forwarded_candles.get(timeframe)
+
+                if forwarded is None or self._has_gap(forwarded, incoming, timeframe):
+                    if forwarded is not None:
+                        logging.warning(f"Hueco detectado en el histórico de {asset} ({timeframe}s). Se reenvía el snapshot completo.")
+                    formatted_candles = [self._format_candle(t, v) for t, v in sorted(incoming.items())]
+                    message = {"type": "historical-candles", "payload": {"asset": asset, "timeframe": timeframe, "candles": formatted_candles}}
+
+                    if self.tcp_server.send(message):
+                        logging.info(f"Encolado paquete histórico de {len(formatted_candles)} velas para {asset} ({timeframe}s).")
+                        record.forwarded_candles[timeframe] = incoming
+                else:
+                    # Solo se envían las velas nuevas o las que cambiaron respecto al último rango reenviado.
+                    changed = [self._format_candle(t, v) for t, v in sorted(incoming.items()) if forwarded.get(t) != v]
+                    if not changed:
+                        logging.debug(f"Paquete histórico sin cambios para {asset} ({timeframe}s). Se omite el envío.")
+                    else:
+                        message = {"type": "historical-candles-delta", "payload": {"asset": asset, "timeframe": timeframe, "candles": changed}}
+                        if self.tcp_server.send(message):
+                            logging.info(f"Encolado delta histórico de {len(changed)} velas para {asset} ({timeframe}s).")
+                            record.forwarded_candles[timeframe] = incoming
+
+                # Los pips de reanudación se envían tanto en snapshots como en deltas, pero solo los
+                # posteriores al último pip reenviado: así un re-sincronizado recupera los ticks del hueco.
                 if timeframe == 60:
-                    logging.info(f"Encolando {len(pips)} pips de reanudación para {asset} (1m)...")
-                    for pip in pips: self.tcp_server.send({"type": "pip", "payload": {"asset": asset, "price": pip[1], "timestamp": pip[0]}})
-        
+                    self._send_resume_pips(record, pips)
+
         elif msg_type == "realtime_pip":
-            if self.asset_manager.is_ready_for_pips(data["asset"]):
+            if self.asset_manager.get_record(data["asset"]) is None:
+                # Pip de un activo desconocido o desalojado: se vuelve a detectar y calentar.
+                logging.info(f"Pip recibido para {data['asset']} sin estado registrado. Se vuelve a detectar.")
+                self.asset_manager.discover_asset(data["asset"])
+            elif self.asset_manager.is_ready_for_pips(data["asset"]):
                 self.active_asset_manager.update_last_pip_time(data["asset"])
-                self.tcp_server.send({"type": "pip", "payload": data})
+                if self.tcp_server.send({"type": "pip", "payload": data}):
+                    self.asset_manager.get_record(data["asset"]).last_forwarded_pip_ts = data["timestamp"]
+
+    def _send_resume_pips(self, record, pips):
+        last_ts = record.last_forwarded_pip_ts
+        new_pips = [pip for pip in pips if last_ts is None or pip[0] > last_ts]
+        if not new_pips:
+            return
+        logging.info(f"Encolando {len(new_pips)} pips de reanudación para {record.name} (1m)...")
+        for pip in sorted(new_pips, key=lambda pip: pip[0]):
+            if self.tcp_server.send({"type": "pip", "payload": {"asset": record.name, "price": pip[1], "timestamp": pip[0]}}):
+                record.last_forwarded_pip_ts = pip[0]
 
-    def setup_websocket_listener(self, ws):
+    def setup_websocket_listener(self, ws, shard_id=0):
         if WEBSOCKET_URL_FRAGMENT in ws.url:
-            logging.info(f"Enganchado al WebSocket de datos: {ws.url}")
-            ws.on("framereceived", lambda payload: asyncio.create_task(self.on_websocket_frame(payload)))
+            logging.info(f"Enganchado al WebSocket de datos del shard {shard_id}: {ws.url}")
+            ws.on("framereceived", lambda payload: asyncio.create_task(self.on_websocket_frame(payload, shard_id)))
+
+    async def _load_page(self, page, shard_id, attempts=2):
+        """Navega la página de un shard al broker, reintentando una vez si falla o expira."""
+        for attempt in range(1, attempts + 1):
+            try:
+                await page.goto(f"https://{BROKER_URL_FRAGMENT}", wait_until="networkidle", timeout=60000)
+                logging.info(f"Página del shard {shard_id} cargada completamente.")
+                return True
+            except Exception as e:
+                logging.error(f"No se pudo navegar a la página del broker en el shard {shard_id} (intento {attempt}/{attempts}). Error: {e}")
+        return False
 
     async def start(self):
         logging.info("Iniciando Cosechador Inteligente con Playwright...")
@@ -485,30 +757,41 @@ class WebSocketHarvester:
             
             await context.add_init_script(init_script)
             
-            page = await context.new_page()
-            
-            self.active_asset_manager.set_page(page)
-            
-            page.on("websocket", self.setup_websocket_listener)
-            
-            logging.info(f"Navegando a la página del broker ({BROKER_URL_FRAGMENT})...")
-            try:
-                await page.goto(f"https://{BROKER_URL_FRAGMENT}", wait_until="networkidle", timeout=60000)
-                logging.info("Página cargada completamente.")
-            except Exception as e:
-                logging.error(f"No se pudo navegar a la página del broker. Error: {e}")
+            # Las páginas comparten el contexto (y la sesión del broker), pero cada una abre su propio socket.
+            # Todas se crean y asignan antes de navegar, para que un activo descubierto en una página
+            # pueda calentarse en la de su shard aunque esta aún esté cargando.
+            pages = []
+            for shard in self.active_asset_manager.shards:
+                page = await context.new_page()
+
+                shard.set_page(page)
+
+                page.on("websocket", lambda ws, shard_id=shard.shard_id: self.setup_websocket_listener(ws, shard_id))
+                pages.append(page)
+
+            logging.info(f"Navegando a la página del broker ({BROKER_URL_FRAGMENT}) en {len(pages)} página(s)...")
+            loaded = await asyncio.gather(*(self._load_page(page, shard_id) for shard_id, page in enumerate(pages)))
+            if not any(loaded):
+                logging.critical("No se pudo cargar ninguna página del broker. Se detiene el cosechador.")
                 return
+            failed = [shard_id for shard_id, ok in enumerate(loaded) if not ok]
+            if failed:
+                logging.error(f"Shards sin página cargada: {failed}. El resto sigue cosechando; sus activos esperarán en warming.")
+            else:
+                logging.info("Páginas cargadas completamente.")
 
             logging.info("Cosechador listo y escuchando activamente.")
             await asyncio.Event().wait()
 
 async def main():
-    active_manager = ActiveAssetManager()
-    asset_manager = AssetStateManager(active_asset_manager=active_manager)
+    active_manager = ShardedAssetManager(SHARD_COUNT)
     tcp_server = TCPServer(TCP_HOST, TCP_PORT)
+    asset_manager = AssetStateManager(active_asset_manager=active_manager, tcp_server=tcp_server)
+    tcp_server.on_client_connected = asset_manager.resync_after_reconnect
     harvester = WebSocketHarvester(tcp_server, asset_manager, active_manager)
 
     active_manager.start_background_tasks()
+    asset_manager.start_background_tasks()
 
     server_task = asyncio.create_task(tcp_server.start())
     await tcp_server.ready_event.wait()
@@ -91,6 +91,20 @@ parentPort.on('message', (msg) => {
         break;
       }
 
+      case 'merge-indicators': {
+        const { asset: deltaAsset, candles: deltaCandles, timeframe: tfString } = msg.data;
+
+        if (!deltaAsset || !tfString || !deltaCandles || deltaCandles.length === 0) {
+          logger.error('WORKER-ANALYSIS: Delta histórico inválido, vacío o sin timeframe válido.');
+          return;
+        }
+
+        const channel = manager.getChannel(deltaAsset, true);
+        channel.indicatorEngine.merge(deltaCandles, tfString);
+        logger.info(`WORKER-ANALYSIS: Delta de ${deltaCandles.length} velas aplicado a ${deltaAsset} (${tfString}).`, { asset: deltaAsset });
+        break;
+      }
+
       default:
         logger.warn(`WORKER-ANALYSIS: Mensaje de tipo desconocido recibido: ${msg.type}`);
     }
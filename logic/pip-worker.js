@@ -105,6 +105,13 @@ parentPort.on('message', (msg) => {
         }
         break;
 
+      case 'reset-sequence': {
+        // El Harvester liberó el activo; al reaparecer, su sequence_id vuelve a empezar en 1.
+        delete expectedSequenceIds[data.asset];
+        delete pipBuffers[data.asset];
+        break;
+      }
+
       case 'prime-current-candle': {
         const { asset: primeAsset, history } = data;
         if (!primeAsset || !history || history.length === 0) return;
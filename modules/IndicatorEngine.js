@@ -317,6 +317,28 @@ class IndicatorEngine {
         }
     }
 
+    /**
+     * Aplica un delta histórico del Harvester: reemplaza las velas existentes con el mismo `time`
+     * y añade las nuevas, sin re-impregnar desde cero.
+     */
+    merge(deltaCandles, timeframe) {
+        const indicatorSet = this.indicators[timeframe];
+        if (!indicatorSet) return;
+
+        const MAX_CANDLES = 200;
+        const byTime = new Map(indicatorSet.candles.map(c => [c.time, c]));
+        deltaCandles.forEach(c => byTime.set(c.time, c));
+        indicatorSet.candles = [...byTime.values()].sort((a, b) => a.time - b.time).slice(-MAX_CANDLES);
+
+        logger.info(`INDICATOR-ENGINE (${timeframe}): Delta de ${deltaCandles.length} velas aplicado (${indicatorSet.candles.length} en total).`);
+
+        if (!indicatorSet.isMature && indicatorSet.candles.length >= indicatorSet.requiredPeriod) {
+            indicatorSet.isMature = true;
+            logger.warn(`INDICATOR-ENGINE (${timeframe}): ¡Indicadores maduros tras delta histórico!`);
+            this.validateEffectiveness(indicatorSet.candles, timeframe);
+        }
+    }
+
     update(candle) {
         const { timeframe } = candle;
         const indicatorSet = this.indicators[timeframe];